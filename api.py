@@ -1,22 +1,76 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, Response
 from flask_cors import CORS
-import json
-import time
+import os
+import orjson
 import base64
 import io
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
+import matplotlib.style
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import seaborn as sns
-from llm_interface import natural_language_to_sql, execute_sql_query, format_results
+from llm_interface import (natural_language_to_sql, forget_sql, split_sql_statements, execute_sql_query,
+                           iter_sql_query, format_results, FETCH_BATCH_SIZE)
 import traceback
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Set a nice style for matplotlib
-plt.style.use('seaborn-v0_8')
+matplotlib.style.use('seaborn-v0_8')
 sns.set_palette("husl")
+
+# Charts show at most this many items; bar colours for every possible size are computed once
+MAX_CHART_ITEMS = 10
+BAR_PALETTES = {n: sns.color_palette("husl", n) for n in range(1, MAX_CHART_ITEMS + 1)}
+
+# Worker pool for work that can overlap within a request: the statements of a
+# multi-step answer and chart rendering. Each worker thread gets its own SQLite connection.
+executor = ThreadPoolExecutor(max_workers=8)
+
+# One figure and canvas (with their renderer and font caches) reused for every chart;
+# figures are not thread-safe, so rendering holds _chart_lock
+_chart_fig = Figure(figsize=(12, 8), layout='tight')
+_chart_canvas = FigureCanvasAgg(_chart_fig)
+_chart_lock = threading.Lock()
+
+def json_response(data):
+    """
+    Serialize data with orjson, which is considerably faster than Flask's jsonify.
+    """
+    return Response(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY), mimetype='application/json')
+
+# Static parts of the per-line 'typing' event, so only the text itself is encoded per frame
+TYPING_EVENT_PREFIX = b'data: {"status":"typing","chunk":'
+TYPING_EVENT_SUFFIX = b'}\n\n'
+
+def sse_event(data):
+    """
+    Encode data as a server-sent event frame.
+    """
+    return b'data: ' + orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n\n'
+
+def execute_statements(statements):
+    """
+    Execute several SQL statements concurrently.
+    Returns a list of (results, column_names), one per statement, in order.
+    """
+    return list(executor.map(execute_sql_query, statements))
+
+def describe_statements(statements, statement_results):
+    """
+    Per-statement breakdown included in responses to multi-step answers.
+    """
+    return [
+        {'sql_query': sql, 'results': results, 'column_names': column_names, 'row_count': len(results)}
+        for sql, (results, column_names) in zip(statements, statement_results)
+    ]
+
 def generate_chart(results, column_names, question="", chart_type="auto"):
     """
     Generate a chart based on query results.
@@ -30,21 +84,11 @@ def generate_chart(results, column_names, question="", chart_type="auto"):
         if len(column_names) < 2:
             return None
         
-        # Convert results to lists for plotting
-        if len(column_names) == 2:
-            labels = [str(row[0]) for row in results]
-            values = [float(row[1]) if isinstance(row[1], (int, float)) else 0 for row in results]
-        else:
-            # For multi-column data, use first column as labels and second as values
-            labels = [str(row[0]) for row in results]
-            values = [float(row[1]) if isinstance(row[1], (int, float)) else 0 for row in results]
-        
-        # Limit to top 10 items for readability
-        if len(labels) > 10:
-            labels = labels[:10]
-            values = values[:10]
-        
-        plt.figure(figsize=(12, 8))
+        # Use first column as labels and second as values, limited to the top items for readability
+        rows = results[:MAX_CHART_ITEMS]
+        labels = tuple(str(row[0]) for row in rows)
+        values = np.fromiter((row[1] if isinstance(row[1], (int, float)) else 0.0 for row in rows),
+                             dtype=np.float64, count=len(rows))
         
         # Determine chart type
         if chart_type == 'auto':
@@ -53,55 +97,78 @@ def generate_chart(results, column_names, question="", chart_type="auto"):
             else:
                 chart_type = 'bar'
         
+        # The values are passed as raw bytes so they can be part of the render cache key
+        return _render_chart(labels, values.tobytes(), column_names[0], column_names[1], question, chart_type)
+        
+    except Exception as e:
+        print(f"Error generating chart: {str(e)}")
+        return None
+
+def _rotate_xticklabels(ax):
+    """
+    Slant the x tick labels without touching the ticks themselves
+    (categorical axes merge repeated labels into one tick).
+    """
+    ax.tick_params(axis='x', labelrotation=45)
+    for tick_label in ax.get_xticklabels():
+        tick_label.set_ha('right')
+
+@lru_cache(maxsize=128)
+def _render_chart(labels, values_bytes, x_label, y_label, question, chart_type):
+    """
+    Render a chart to a base64 encoded PNG.
+    Cached on the plotted data so repeated questions skip rendering entirely.
+    Draws on the shared figure, which is locked for the duration.
+    """
+    values = np.frombuffer(values_bytes, dtype=np.float64)
+    
+    with _chart_lock:
+        # Fresh axes on the shared figure: Axes.clear() would keep pie-chart state (aspect, frame)
+        fig = _chart_fig
+        fig.clear()
+        ax = fig.add_subplot()
+        
         if chart_type == 'bar':
-            bars = plt.bar(labels, values, color=sns.color_palette("husl", len(labels)))
-            plt.xlabel(column_names[0])
-            plt.ylabel(column_names[1] if len(column_names) > 1 else 'Value')
-            plt.xticks(rotation=45, ha='right')
-            
+            bars = ax.bar(labels, values, color=BAR_PALETTES[len(labels)])
+            ax.set_xlabel(x_label)
+            ax.set_ylabel(y_label)
+            _rotate_xticklabels(ax)
+        
             # Add value labels on bars
+            label_offset = values.max() * 0.01
             for bar, value in zip(bars, values):
-                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(values)*0.01,
+                ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + label_offset,
                         f'{value:.2f}' if isinstance(value, float) else str(value),
                         ha='center', va='bottom')
         
         elif chart_type == 'pie':
-            plt.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
-            plt.axis('equal')
+            ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
+            ax.axis('equal')
         
         elif chart_type == 'line':
-            plt.plot(labels, values, marker='o', linewidth=2, markersize=8)
-            plt.xlabel(column_names[0])
-            plt.ylabel(column_names[1] if len(column_names) > 1 else 'Value')
-            plt.xticks(rotation=45, ha='right')
-            plt.grid(True, alpha=0.3)
+            ax.plot(labels, values, marker='o', linewidth=2, markersize=8)
+            ax.set_xlabel(x_label)
+            ax.set_ylabel(y_label)
+            _rotate_xticklabels(ax)
+            ax.grid(True, alpha=0.3)
         
         # Set title
         title = f"Results for: {question}" if question else "Query Results"
-        plt.title(title, fontsize=14, fontweight='bold', pad=20)
-        
-        plt.tight_layout()
+        ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
         
         # Save to base64
         buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        plt.close()
-        
-        return image_base64
-        
-    except Exception as e:
-        print(f"Error generating chart: {str(e)}")
-        plt.close()
-        return None
+        fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight', pil_kwargs={'optimize': True})
+        # getbuffer() exposes the PNG bytes without the copy getvalue() makes;
+        # base64 output is pure ASCII, which decodes faster than UTF-8
+        return base64.b64encode(buffer.getbuffer()).decode('ascii')
 
 @app.route('/')
 def home():
     """
     Home endpoint with API information.
     """
-    return jsonify({
+    return json_response({
         'message': 'AI Agent for E-commerce Data API',
         'version': '1.0.0',
         'endpoints': {
@@ -127,13 +194,13 @@ def health():
         from llm_interface import get_table_schema
         schema = get_table_schema()
         
-        return jsonify({
+        return json_response({
             'status': 'healthy',
             'database': 'connected',
             'tables': list(schema.keys()) if schema else []
         })
     except Exception as e:
-        return jsonify({
+        return json_response({
             'status': 'unhealthy',
             'error': str(e)
         }), 500
@@ -146,23 +213,38 @@ def query_data():
     try:
         data = request.get_json()
         if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+            return json_response({'error': 'No JSON data provided'}), 400
         
         question = data.get('question')
         visualize = data.get('visualize', False)
         chart_type = data.get('chart_type', 'auto')
         
         if not question:
-            return jsonify({'error': 'No question provided'}), 400
+            return json_response({'error': 'No question provided'}), 400
         
         # Generate SQL query
-        sql_query = natural_language_to_sql(question)
+        sql_query, sql_params = natural_language_to_sql(question)
+        statements = split_sql_statements(sql_query) if not sql_params else [sql_query]
         
-        # Execute query
-        results, column_names = execute_sql_query(sql_query)
+        # Execute query; the statements of a multi-step answer run in parallel
+        try:
+            if len(statements) > 1:
+                statement_results = execute_statements(statements)
+            else:
+                statement_results = [execute_sql_query(sql_query, params=sql_params)]
+        except Exception:
+            # Don't keep serving SQL that does not run
+            forget_sql(question, sql_query)
+            raise
+        results, column_names = statement_results[-1]
+        
+        # Render the chart (if requested) while the results are being formatted
+        chart_future = None
+        if visualize and results and len(results) > 0:
+            chart_future = executor.submit(generate_chart, results, column_names, question, chart_type)
         
         # Format results
-        formatted_results = format_results(results, column_names)
+        formatted_results = '\n\n'.join(format_results(r, c) for r, c in statement_results)
         
         response_data = {
             'question': question,
@@ -172,22 +254,29 @@ def query_data():
             'formatted_results': formatted_results,
             'row_count': len(results)
         }
+        if sql_params:
+            response_data['sql_params'] = sql_params
+        if len(statements) > 1:
+            response_data['statements'] = describe_statements(statements, statement_results)
         
-        # Generate visualization if requested
-        if visualize and results and len(results) > 0:
-            chart_image = generate_chart(results, column_names, question, chart_type)
+        # Attach the visualization
+        if chart_future is not None:
+            chart_image = chart_future.result()
             if chart_image:
                 response_data['chart_image_base64'] = chart_image
         
-        return jsonify(response_data)
+        return json_response(response_data)
         
     except Exception as e:
+        app.logger.exception(e)
         error_details = {
             'error': str(e),
-            'type': type(e).__name__,
-            'traceback': traceback.format_exc()
+            'type': type(e).__name__
         }
-        return jsonify(error_details), 500
+        # Tracebacks are costly to build and only useful while developing
+        if app.debug or os.getenv('API_DEBUG'):
+            error_details['traceback'] = traceback.format_exc()
+        return json_response(error_details), 500
 
 @app.route('/stream_query', methods=['POST'])
 def stream_query_data():
@@ -197,42 +286,56 @@ def stream_query_data():
     try:
         data = request.get_json()
         if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+            return json_response({'error': 'No JSON data provided'}), 400
         
         question = data.get('question')
         if not question:
-            return jsonify({'error': 'No question provided'}), 400
+            return json_response({'error': 'No question provided'}), 400
         
         def generate():
             try:
                 # Step 1: Processing
-                yield f"data: {json.dumps({'status': 'thinking', 'message': 'Processing your question...'})}\n\n"
-                time.sleep(0.5)
+                yield sse_event({'status': 'thinking', 'message': 'Processing your question...'})
                 
                 # Step 2: SQL Generation
-                yield f"data: {json.dumps({'status': 'generating_sql', 'message': 'Converting to SQL query...'})}\n\n"
-                sql_query = natural_language_to_sql(question)
-                yield f"data: {json.dumps({'status': 'sql_generated', 'sql_query': sql_query})}\n\n"
-                time.sleep(0.5)
+                yield sse_event({'status': 'generating_sql', 'message': 'Converting to SQL query...'})
+                sql_query, sql_params = natural_language_to_sql(question)
+                sql_data = {'status': 'sql_generated', 'sql_query': sql_query}
+                if sql_params:
+                    sql_data['sql_params'] = sql_params
+                yield sse_event(sql_data)
                 
                 # Step 3: Query Execution
-                yield f"data: {json.dumps({'status': 'executing', 'message': 'Executing database query...'})}\n\n"
-                results, column_names = execute_sql_query(sql_query)
-                yield f"data: {json.dumps({'status': 'results_fetched', 'message': f'Found {len(results)} results'})}\n\n"
-                time.sleep(0.5)
+                yield sse_event({'status': 'executing', 'message': 'Executing database query...'})
+                statements = split_sql_statements(sql_query) if not sql_params else [sql_query]
+                try:
+                    if len(statements) > 1:
+                        statement_results = execute_statements(statements)
+                        results, column_names = statement_results[-1]
+                    else:
+                        results = []
+                        for batch, column_names in iter_sql_query(sql_query, params=sql_params):
+                            results.extend(batch)
+                            if len(batch) == FETCH_BATCH_SIZE:
+                                yield sse_event({'status': 'fetching', 'message': f'Fetched {len(results)} rows...'})
+                        statement_results = [(results, column_names)]
+                except Exception:
+                    # Don't keep serving SQL that does not run
+                    forget_sql(question, sql_query)
+                    raise
+                yield sse_event({'status': 'results_fetched', 'message': f'Found {len(results)} results'})
                 
                 # Step 4: Formatting Results
-                yield f"data: {json.dumps({'status': 'formatting', 'message': 'Formatting results...'})}\n\n"
-                formatted_results = format_results(results, column_names)
+                yield sse_event({'status': 'formatting', 'message': 'Formatting results...'})
+                formatted_results = '\n\n'.join(format_results(r, c) for r, c in statement_results)
                 
-                # Step 5: Streaming the formatted response with typing effect
-                yield f"data: {json.dumps({'status': 'typing_start', 'message': 'Generating response...'})}\n\n"
+                # Step 5: Streaming the formatted response line by line
+                yield sse_event({'status': 'typing_start', 'message': 'Generating response...'})
                 
                 response_text = f"Here are the results for your question: '{question}'\n\n{formatted_results}"
                 
-                for char in response_text:
-                    yield f"data: {json.dumps({'status': 'typing', 'char': char})}\n\n"
-                    time.sleep(0.02)  # Typing speed
+                for chunk in response_text.splitlines(keepends=True):
+                    yield TYPING_EVENT_PREFIX + orjson.dumps(chunk) + TYPING_EVENT_SUFFIX
                 
                 # Step 6: Complete
                 final_data = {
@@ -244,7 +347,11 @@ def stream_query_data():
                     'formatted_results': formatted_results,
                     'row_count': len(results)
                 }
-                yield f"data: {json.dumps(final_data)}\n\n"
+                if sql_params:
+                    final_data['sql_params'] = sql_params
+                if len(statements) > 1:
+                    final_data['statements'] = describe_statements(statements, statement_results)
+                yield sse_event(final_data)
                 
             except Exception as e:
                 error_data = {
@@ -252,14 +359,14 @@ def stream_query_data():
                     'error': str(e),
                     'type': type(e).__name__
                 }
-                yield f"data: {json.dumps(error_data)}\n\n"
+                yield sse_event(error_data)
         
         return Response(generate(), mimetype='text/event-stream',
                        headers={'Cache-Control': 'no-cache',
                                'Connection': 'keep-alive'})
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}), 500
 
 @app.route('/schema')
 def get_schema():
@@ -272,12 +379,12 @@ def get_schema():
         schema = get_table_schema()
         samples = get_sample_data(limit=2)
         
-        return jsonify({
+        return json_response({
             'schema': schema,
             'sample_data': samples
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}), 500
 
 if __name__ == '__main__':
     print("Starting AI Agent for E-commerce Data API...")
@@ -290,4 +397,5 @@ if __name__ == '__main__':
     print("\nExample curl command:")
     print('curl -X POST -H "Content-Type: application/json" -d \'{"question": "What is the total sales?"}\' http://localhost:5000/query')
     
+    # Development server only; in production run wsgi:app under gunicorn (see DEPLOYMENT_GUIDE.md)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -1,41 +1,149 @@
-import pandas as pd
+import csv
 import sqlite3
 import os
 
+# Tables created by create_and_populate_db and the CSV file each one is loaded from
+CSV_TABLES = [
+    ('ad_sales', 'Product-LevelAdSalesandMetrics(mapped)-Product-LevelAdSalesandMetrics(mapped).csv'),
+    ('total_sales', 'Product-LevelTotalSalesandMetrics(mapped)-Product-LevelTotalSalesandMetrics(mapped).csv'),
+    ('eligibility', 'Product-LevelEligibilityTable(mapped)-Product-LevelEligibilityTable(mapped).csv'),
+]
+
+# Derived metrics stored alongside the loaded columns so queries can sort on them directly
+GENERATED_COLUMNS = {
+    'ad_sales': [
+        '"roas" REAL GENERATED ALWAYS AS (CASE WHEN ad_spend > 0 THEN ad_sales * 1.0 / ad_spend ELSE 0 END) STORED',
+        '"cpc" REAL GENERATED ALWAYS AS (CASE WHEN clicks > 0 THEN ad_spend * 1.0 / clicks ELSE 0 END) STORED',
+    ],
+}
+
+# Indexes for the columns the API filters and sorts on, created after each table is loaded
+TABLE_INDEXES = {
+    'ad_sales': [
+        'CREATE INDEX idx_ad_sales_item ON ad_sales(item_id)',
+        'CREATE INDEX idx_ad_sales_spend ON ad_sales(ad_spend) WHERE ad_spend > 0',
+        'CREATE INDEX idx_ad_sales_clicks ON ad_sales(clicks) WHERE clicks > 0',
+        'CREATE INDEX idx_ad_sales_roas ON ad_sales(roas) WHERE ad_spend > 0',
+        'CREATE INDEX idx_ad_sales_cpc ON ad_sales(cpc) WHERE clicks > 0',
+    ],
+    'total_sales': [
+        'CREATE INDEX idx_total_sales_item ON total_sales(item_id)',
+    ],
+    'eligibility': [
+        'CREATE INDEX idx_eligibility_item ON eligibility(item_id)',
+        'CREATE INDEX idx_eligibility_eligibility ON eligibility(eligibility)',
+    ],
+}
+
+# TRUE/FALSE columns are stored as 1/0, matching how pandas wrote them
+BOOLEAN_VALUES = {'TRUE': 1, 'FALSE': 0}
+
+def _value_type(value):
+    """
+    Classify a single CSV value as 'INTEGER', 'REAL', 'BOOLEAN' or 'TEXT'.
+    """
+    try:
+        int(value)
+        return 'INTEGER'
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return 'REAL'
+    except ValueError:
+        pass
+    if value.upper() in BOOLEAN_VALUES:
+        return 'BOOLEAN'
+    return 'TEXT'
+
+def _infer_column_types(csv_file):
+    """
+    Read a CSV file once and infer a SQLite type for every column.
+    Returns (header, column_types); empty cells are ignored.
+    """
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        seen = [set() for _ in header]
+        for row in reader:
+            for i, value in enumerate(row):
+                if value != '':
+                    seen[i].add(_value_type(value))
+    
+    column_types = []
+    for types in seen:
+        if types == {'BOOLEAN'}:
+            column_types.append('BOOLEAN')
+        elif types <= {'INTEGER'}:
+            column_types.append('INTEGER')
+        elif types <= {'INTEGER', 'REAL'}:
+            column_types.append('REAL')
+        else:
+            column_types.append('TEXT')
+    return header, column_types
+
+def _convert_rows(reader, column_types):
+    """
+    Turn CSV rows into insertable tuples: empty cells become NULL and booleans 1/0.
+    Numeric strings are left for SQLite's column affinity to convert.
+    """
+    boolean_columns = [i for i, t in enumerate(column_types) if t == 'BOOLEAN']
+    for row in reader:
+        values = [value if value != '' else None for value in row]
+        for i in boolean_columns:
+            if values[i] is not None:
+                values[i] = BOOLEAN_VALUES[values[i].upper()]
+        yield values
+
+def load_csv_table(conn, table_name, csv_file):
+    """
+    (Re)create table_name from csv_file with a single executemany() insert, then index it.
+    Returns the number of rows loaded.
+    """
+    header, column_types = _infer_column_types(csv_file)
+    columns = ', '.join(
+        [f'"{name}" {"INTEGER" if col_type == "BOOLEAN" else col_type}'
+         for name, col_type in zip(header, column_types)]
+        + GENERATED_COLUMNS.get(table_name, [])
+    )
+    column_list = ', '.join(f'"{name}"' for name in header)
+    placeholders = ', '.join('?' for _ in header)
+    
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        with conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            conn.execute(f'CREATE TABLE "{table_name}" ({columns})')
+            cursor = conn.executemany(
+                f'INSERT INTO "{table_name}" ({column_list}) VALUES ({placeholders})',
+                _convert_rows(reader, column_types)
+            )
+            for statement in TABLE_INDEXES.get(table_name, []):
+                conn.execute(statement)
+    return cursor.rowcount
+
 def create_and_populate_db(db_name='ecommerce.db', data_folder='data'):
     """
     Create and populate SQLite database with e-commerce data from CSV files.
     """
     conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
     
     try:
-        # Product-Level Ad Sales and Metrics
-        ad_sales_file = os.path.join(data_folder, 'Product-LevelAdSalesandMetrics(mapped)-Product-LevelAdSalesandMetrics(mapped).csv')
-        if os.path.exists(ad_sales_file):
-            ad_sales_df = pd.read_csv(ad_sales_file)
-            ad_sales_df.to_sql('ad_sales', conn, if_exists='replace', index=False)
-            print(f'Table ad_sales created and populated with {len(ad_sales_df)} rows.')
-        else:
-            print(f'Warning: {ad_sales_file} not found.')
+        # Durability is pointless while bulk loading a database we can always rebuild
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA journal_mode=MEMORY')
         
-        # Product-Level Total Sales and Metrics
-        total_sales_file = os.path.join(data_folder, 'Product-LevelTotalSalesandMetrics(mapped)-Product-LevelTotalSalesandMetrics(mapped).csv')
-        if os.path.exists(total_sales_file):
-            total_sales_df = pd.read_csv(total_sales_file)
-            total_sales_df.to_sql('total_sales', conn, if_exists='replace', index=False)
-            print(f'Table total_sales created and populated with {len(total_sales_df)} rows.')
-        else:
-            print(f'Warning: {total_sales_file} not found.')
+        for table_name, file_name in CSV_TABLES:
+            csv_file = os.path.join(data_folder, file_name)
+            if os.path.exists(csv_file):
+                row_count = load_csv_table(conn, table_name, csv_file)
+                print(f'Table {table_name} created and populated with {row_count} rows.')
+            else:
+                print(f'Warning: {csv_file} not found.')
         
-        # Product-Level Eligibility Table
-        eligibility_file = os.path.join(data_folder, 'Product-LevelEligibilityTable(mapped)-Product-LevelEligibilityTable(mapped).csv')
-        if os.path.exists(eligibility_file):
-            eligibility_df = pd.read_csv(eligibility_file)
-            eligibility_df.to_sql('eligibility', conn, if_exists='replace', index=False)
-            print(f'Table eligibility created and populated with {len(eligibility_df)} rows.')
-        else:
-            print(f'Warning: {eligibility_file} not found.')
+        # Collect statistics so the query planner knows when the indexes pay off
+        conn.execute('ANALYZE')
             
     except Exception as e:
         print(f'Error creating database: {str(e)}')
@@ -55,7 +163,7 @@ def get_database_info(db_name='ecommerce.db'):
     
     try:
         # Get all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
         tables = cursor.fetchall()
         
         print(f'\nDatabase: {db_name}')
@@ -66,8 +174,8 @@ def get_database_info(db_name='ecommerce.db'):
             print(f'\nTable: {table_name}')
             print('-' * 30)
             
-            # Get table schema
-            cursor.execute(f"PRAGMA table_info({table_name});")
+            # Get table schema (table_xinfo also lists generated columns)
+            cursor.execute(f"PRAGMA table_xinfo({table_name});")
             columns = cursor.fetchall()
             
             for col in columns:
@@ -118,8 +118,8 @@ function App() {
             try {
               const data = JSON.parse(line.slice(6))
               
-              if (data.status === 'typing' && data.char) {
-                setStreamingText(prev => prev + data.char)
+              if (data.status === 'typing' && data.chunk) {
+                setStreamingText(prev => prev + data.chunk)
               } else if (data.status === 'complete') {
                 setResults(data)
               } else if (data.status === 'error') {
@@ -1,33 +1,153 @@
 import sqlite3
 import json
+import os
 import re
-from typing import Dict, List, Tuple, Optional
+import threading
+from typing import Dict, Iterator, List, Tuple, Optional
+
+import pandas as pd
 
 # Note: For production use, you would import ollama
 import ollama
 
+from sql_cache import TTLCache, SemanticCache, normalize_question
+
+# Ollama model used to embed questions for the semantic cache (all-MiniLM-L6-v2)
+EMBEDDING_MODEL = 'all-minilm'
+SEMANTIC_CACHE_THRESHOLD = 0.92
+
+def _embed_question(text: str) -> List[float]:
+    return ollama.embeddings(model=EMBEDDING_MODEL, prompt=text)['embedding']
+
+# Generated SQL keyed by (db_name, model, normalized question)
+_sql_cache = TTLCache(maxsize=1024, ttl=3600)
+_semantic_sql_cache = SemanticCache(_embed_question, threshold=SEMANTIC_CACHE_THRESHOLD)
+# Query results keyed by (db_name, SQL text); the data is static while the API runs
+_result_cache = TTLCache(maxsize=256, ttl=600)
+
+def clear_query_caches():
+    """
+    Drop all cached SQL and query results, e.g. after the database is rebuilt.
+    """
+    _sql_cache.clear()
+    _semantic_sql_cache.clear()
+    _result_cache.clear()
+
+def forget_sql(question: str, sql_query: str, model='llama2', db_name='ecommerce.db'):
+    """
+    Evict SQL generated for question from the SQL caches, e.g. after it failed to execute,
+    so the next ask gets a fresh generation instead of the same broken query.
+    """
+    _sql_cache.discard((db_name, model, normalize_question(question)))
+    _semantic_sql_cache.discard(sql_query, namespace=(db_name, model))
+
+# One SQLite connection per thread and database, reused across requests
+_local = threading.local()
+
+# Authorizer actions allowed on API connections; everything else (DDL, DML, ATTACH, ...) is denied
+_READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+# Pragmas that only report schema information; every other pragma is denied,
+# including argument-less ones such as wal_checkpoint, optimize and integrity_check
+_READ_ONLY_PRAGMAS = {
+    'table_info', 'table_xinfo', 'table_list', 'index_list', 'index_info', 'index_xinfo',
+    'foreign_key_list', 'database_list', 'collation_list',
+}
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    """
+    SQLite authorizer that only lets generated SQL read data.
+    """
+    if action in _READ_ONLY_ACTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg1 in _READ_ONLY_PRAGMAS:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+def _get_connection(db_name='ecommerce.db') -> sqlite3.Connection:
+    """
+    Return the calling thread's connection to db_name, opening it on first use.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        # First use in this thread, or we are a freshly forked worker whose
+        # inherited connections belong to the parent process
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    
+    conn = connections.get(db_name)
+    if conn is None:
+        # A large statement cache lets repeated queries skip SQLite's parse/plan step
+        conn = sqlite3.connect(db_name, check_same_thread=False, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA cache_size=-65536')
+        conn.set_authorizer(_read_only_authorizer)
+        connections[db_name] = conn
+    return conn
+
+def close_connections():
+    """
+    Close the calling thread's SQLite connections (e.g. before a pre-forking server forks).
+    """
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+# The schema and sample rows are static while the API runs, so they are read once per database
+_SCHEMA_CACHE: Dict[str, Dict[str, List[str]]] = {}
+_SAMPLES_CACHE: Dict[Tuple[str, int], Dict[str, List[Tuple]]] = {}
+_SCHEMA_PROMPT_CACHE: Dict[str, Dict[str, str]] = {}
+
+def invalidate_schema_cache():
+    """
+    Forget cached schema, sample data and prompt fragments (e.g. after rebuilding the database).
+    """
+    _SCHEMA_CACHE.clear()
+    _SAMPLES_CACHE.clear()
+    _SCHEMA_PROMPT_CACHE.clear()
+
+def invalidate_prompt_cache(db_name='ecommerce.db'):
+    """
+    Re-read the schema and sample data of db_name and rebuild its prompt fragments now,
+    so the next question does not pay for it.
+    """
+    invalidate_schema_cache()
+    _schema_prompt_fragments(db_name)
+
 def get_table_schema(db_name='ecommerce.db') -> Dict[str, List[str]]:
     """
     Get the schema of all tables in the database.
     Returns a dictionary with table names as keys and column lists as values.
     """
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+    if db_name in _SCHEMA_CACHE:
+        return _SCHEMA_CACHE[db_name]
+    
+    conn = _get_connection(db_name)
     schema = {}
     
     try:
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+            tables = cursor.fetchall()
+            
+            for table_name in tables:
+                table_name = table_name[0]
+                # table_xinfo also lists generated columns; hidden (virtual table) columns are skipped
+                cursor.execute(f"PRAGMA table_xinfo({table_name});")
+                columns = cursor.fetchall()
+                schema[table_name] = [col[1] for col in columns if col[6] != 1]
         
-        for table_name in tables:
-            table_name = table_name[0]
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns = cursor.fetchall()
-            schema[table_name] = [col[1] for col in columns]
+        if schema:
+            _SCHEMA_CACHE[db_name] = schema
     except Exception as e:
         print(f"Error getting schema: {str(e)}")
-    finally:
-        conn.close()
     
     return schema
 
@@ -35,133 +155,226 @@ def get_sample_data(db_name='ecommerce.db', limit=3) -> Dict[str, List[Tuple]]:
     """
     Get sample data from each table to help with SQL generation.
     """
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+    if (db_name, limit) in _SAMPLES_CACHE:
+        return _SAMPLES_CACHE[(db_name, limit)]
+    
+    conn = _get_connection(db_name)
     samples = {}
     
     try:
         schema = get_table_schema(db_name)
-        for table_name in schema.keys():
-            cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit};")
-            samples[table_name] = cursor.fetchall()
+        with conn:
+            cursor = conn.cursor()
+            for table_name in schema.keys():
+                cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit};")
+                samples[table_name] = cursor.fetchall()
+        
+        if samples:
+            _SAMPLES_CACHE[(db_name, limit)] = samples
     except Exception as e:
         print(f"Error getting sample data: {str(e)}")
-    finally:
-        conn.close()
     
     return samples
 
-def natural_language_to_sql_fallback(question: str, db_name='ecommerce.db') -> str:
+# Sample values longer than this are cut short in the prompt
+PROMPT_SAMPLE_MAX_CHARS = 40
+
+# Question words that make a table relevant to the prompt (besides its own column names)
+_TABLE_KEYWORDS = {
+    'ad_sales': {'ad', 'ads', 'advertising', 'spend', 'spent', 'click', 'clicks', 'impression',
+                 'impressions', 'roas', 'cpc', 'campaign'},
+    'total_sales': {'sales', 'sale', 'sold', 'order', 'orders', 'ordered', 'units', 'revenue'},
+    'eligibility': {'eligible', 'eligibility', 'ineligible'},
+}
+
+# Prompt notes for each table, included only when the table is in the prompt
+_TABLE_NOTES = {
+    'ad_sales': [
+        "The 'ad_sales' table contains advertising metrics (ad_sales, impressions, ad_spend, clicks, units_sold). When calculating CPC (Cost Per Click), use the precomputed 'cpc' column (ad_spend / clicks, 0 when there are no clicks) of the 'ad_sales' table.",
+        "RoAS (Return on Ad Spend) = ad_sales / ad_spend. When calculating RoAS, use the precomputed 'roas' column (0 when there is no ad spend) of the 'ad_sales' table.",
+    ],
+    'total_sales': [
+        "The 'total_sales' table contains total sales data (total_sales, total_units_ordered)",
+    ],
+    'eligibility': [
+        "The 'eligibility' table contains product eligibility information",
+    ],
+}
+
+_WORD_RE = re.compile(r'[a-z_]+')
+
+_PROMPT_TEMPLATE = """Given the following SQLite database schema and sample data:
+
+{schema}
+
+Important notes:
+{notes}- Use proper SQL syntax for SQLite
+- Return only the SQL query, no explanations
+
+Convert this natural language question into a SQLite SQL query:
+Question: {question}
+
+SQL Query:"""
+
+def _truncate(value, max_chars=PROMPT_SAMPLE_MAX_CHARS) -> str:
+    text = str(value)
+    return text if len(text) <= max_chars else text[:max_chars - 3] + '...'
+
+def _schema_prompt_fragments(db_name='ecommerce.db') -> Dict[str, str]:
     """
-    Fallback SQL generation for common queries when LLM is not available.
-    This is a simplified version for demonstration purposes.
+    Build the schema + sample data description of each table used in the LLM prompt.
+    The fragments are built once per database and reused for every question.
     """
-    question_lower = question.lower()
+    if db_name in _SCHEMA_PROMPT_CACHE:
+        return _SCHEMA_PROMPT_CACHE[db_name]
+    
+    schema = get_table_schema(db_name)
+    samples = get_sample_data(db_name)
     
-    # Common patterns and their SQL equivalents
-    if 'total sales' in question_lower:
-        if 'item_id' in question_lower:
-            # Extract item_id if mentioned
-            match = re.search(r'item\s*id\s*(\d+)', question_lower)
-            if match:
-                item_id = match.group(1)
-                return f"SELECT SUM(total_sales) as total_sales FROM total_sales WHERE item_id = {item_id};"
-        return "SELECT SUM(total_sales) as total_sales FROM total_sales;"
-    
-    elif 'roas' in question_lower or 'return on ad spend' in question_lower:
-        return """
+    # Create detailed schema description
+    fragments = {}
+    for table, columns in schema.items():
+        fragment = f"Table '{table}': {', '.join(columns)}"
+        
+        # Add sample data for context
+        if table in samples and samples[table]:
+            sample_row = samples[table][0]
+            sample_desc = ', '.join([f"{col}={_truncate(val)}" for col, val in zip(columns, sample_row)])
+            fragment += f"\n  Sample: {sample_desc}"
+        fragments[table] = fragment
+    
+    if fragments:
+        _SCHEMA_PROMPT_CACHE[db_name] = fragments
+    return fragments
+
+def get_schema_prompt(db_name='ecommerce.db', tables: Optional[List[str]] = None) -> str:
+    """
+    Schema + sample data description for the given tables (all tables by default).
+    """
+    fragments = _schema_prompt_fragments(db_name)
+    if tables is None:
+        tables = list(fragments)
+    return '\n'.join(fragments[table] for table in tables if table in fragments)
+
+def select_prompt_tables(question: str, db_name='ecommerce.db') -> List[str]:
+    """
+    Pick the tables a question is about, from keywords and column names it mentions.
+    Returns every table when nothing matches, so the prompt never loses context it needs.
+    """
+    schema = get_table_schema(db_name)
+    words = set(_WORD_RE.findall(question.lower()))
+    tables = [table for table, columns in schema.items()
+              if words & (_TABLE_KEYWORDS.get(table, set()) | set(columns))]
+    return tables or list(schema)
+
+# Fallback patterns, compiled once at import
+_ITEM_ID_RE = re.compile(r'\bitem[\s_]*id\s*=?\s*(\d+)\b')
+_NOT_ELIGIBLE_RE = re.compile(r'false|not eligible')
+_ROAS_RE = re.compile(r'\broas\b|return on ad spend')
+_CPC_RE = re.compile(r'highest cpc|cost per click')
+
+# Per-item lookup with a bound parameter, so SQLite reuses one cached plan for every item
+_ITEM_SALES_SQL = "SELECT SUM(total_sales) as total_sales FROM total_sales WHERE item_id = ?;"
+
+def _total_sales_sql(question_lower: str) -> Tuple[str, Tuple]:
+    # Extract item_id if mentioned
+    match = _ITEM_ID_RE.search(question_lower)
+    if match:
+        return _ITEM_SALES_SQL, (int(match.group(1)),)
+    return "SELECT SUM(total_sales) as total_sales FROM total_sales;", ()
+
+def _roas_sql(question_lower: str) -> Tuple[str, Tuple]:
+    # roas is a stored generated column on ad_sales, so the sort can use its index
+    return """
         SELECT 
             a.item_id,
             a.ad_sales,
             a.ad_spend,
-            CASE 
-                WHEN a.ad_spend > 0 THEN ROUND(a.ad_sales / a.ad_spend, 2)
-                ELSE 0 
-            END as roas
+            ROUND(a.roas, 2) as roas
         FROM ad_sales a 
         WHERE a.ad_spend > 0
-        ORDER BY roas DESC;
-        """
-    
-    elif 'highest cpc' in question_lower or 'cost per click' in question_lower:
-        return """
+        ORDER BY a.roas DESC;
+        """, ()
+
+def _cpc_sql(question_lower: str) -> Tuple[str, Tuple]:
+    return """
         SELECT 
-            item_id,
-            ad_spend,
-            clicks,
-            CASE 
-                WHEN clicks > 0 THEN ROUND(ad_spend / clicks, 2)
-                ELSE 0 
-            END as cpc
-        FROM ad_sales 
-        WHERE clicks > 0
-        ORDER BY cpc DESC
+            a.item_id,
+            a.ad_spend,
+            a.clicks,
+            ROUND(a.cpc, 2) as cpc
+        FROM ad_sales a 
+        WHERE a.clicks > 0
+        ORDER BY a.cpc DESC
         LIMIT 10;
-        """
-    
-    elif 'eligibility' in question_lower:
-        if 'false' in question_lower or 'not eligible' in question_lower:
-            return "SELECT * FROM eligibility WHERE eligibility = 'FALSE';"
-        return "SELECT * FROM eligibility;"
+        """, ()
+
+def _eligibility_sql(question_lower: str) -> Tuple[str, Tuple]:
+    if _NOT_ELIGIBLE_RE.search(question_lower):
+        return "SELECT * FROM eligibility WHERE eligibility = 0;", ()
+    return "SELECT * FROM eligibility;", ()
+
+def _impressions_sql(question_lower: str) -> Tuple[str, Tuple]:
+    return "SELECT item_id, SUM(impressions) as total_impressions FROM ad_sales GROUP BY item_id ORDER BY total_impressions DESC;", ()
+
+# Common patterns and their SQL builders, checked in order; the first match wins
+_FALLBACK_PATTERNS = [
+    (re.compile(r'total sales'), _total_sales_sql),
+    (_ROAS_RE, _roas_sql),
+    (_CPC_RE, _cpc_sql),
+    (re.compile(r'eligibility'), _eligibility_sql),
+    (re.compile(r'impressions'), _impressions_sql),
+]
+
+def natural_language_to_sql_fallback(question: str, db_name='ecommerce.db') -> Tuple[str, Tuple]:
+    """
+    Fallback SQL generation for common queries when LLM is not available.
+    This is a simplified version for demonstration purposes.
+    Returns (sql_query, params) where params are bound to the query's ? placeholders.
+    """
+    question_lower = question.lower()
     
-    elif 'impressions' in question_lower:
-        return "SELECT item_id, SUM(impressions) as total_impressions FROM ad_sales GROUP BY item_id ORDER BY total_impressions DESC;"
+    for pattern, build_sql in _FALLBACK_PATTERNS:
+        if pattern.search(question_lower):
+            return build_sql(question_lower)
     
-    else:
-        # Default query - show some basic stats
-        return "SELECT COUNT(*) as total_products FROM (SELECT DISTINCT item_id FROM total_sales);"
+    # Default query - show some basic stats
+    return "SELECT COUNT(*) as total_products FROM (SELECT DISTINCT item_id FROM total_sales);", ()
 
-def natural_language_to_sql(question: str, model='llama2', db_name='ecommerce.db') -> str:
+def natural_language_to_sql(question: str, model='llama2', db_name='ecommerce.db') -> Tuple[str, Tuple]:
     """
     Convert natural language question to SQL query.
     Falls back to pattern matching if Ollama is not available.
+    Returns (sql_query, params); params is empty for LLM-generated SQL.
     """
     question_lower = question.lower()
     
     # Check for specific patterns that work better with fallback
-    if ('roas' in question_lower or 'return on ad spend' in question_lower or 
-        'highest cpc' in question_lower or 'cost per click' in question_lower):
+    if _ROAS_RE.search(question_lower) or _CPC_RE.search(question_lower):
         print("Using fallback for RoAS/CPC calculation...")
         return natural_language_to_sql_fallback(question, db_name)
     
+    # Serve repeated or paraphrased questions without another LLM round-trip
+    cache_key = (db_name, model, normalize_question(question))
+    cached_sql = _sql_cache.get(cache_key)
+    if cached_sql is None:
+        cached_sql = _semantic_sql_cache.get(question, namespace=(db_name, model))
+        if cached_sql is not None:
+            _sql_cache.put(cache_key, cached_sql)
+    if cached_sql is not None:
+        return cached_sql, ()
+    
     try:
         # Try to use Ollama if available
         import ollama
         
-        schema = get_table_schema(db_name)
-        samples = get_sample_data(db_name)
-        
-        # Create detailed schema description
-        schema_description = []
-        for table, columns in schema.items():
-            schema_description.append(f"Table '{table}': {', '.join(columns)}")
-            
-            # Add sample data for context
-            if table in samples and samples[table]:
-                sample_row = samples[table][0]
-                sample_desc = ', '.join([f"{col}={val}" for col, val in zip(columns, sample_row)])
-                schema_description.append(f"  Sample: {sample_desc}")
-        
-        schema_str = '\n'.join(schema_description)
+        # Only describe the tables the question is about, which keeps the prompt short
+        tables = select_prompt_tables(question, db_name)
+        schema_str = get_schema_prompt(db_name, tables)
+        notes_str = ''.join(f"- {note}\n" for table in tables for note in _TABLE_NOTES.get(table, []))
         
-        prompt = f"""Given the following SQLite database schema and sample data:
-
-{schema_str}
-
-Important notes:
-- The 'ad_sales' table contains advertising metrics (ad_sales, impressions, ad_spend, clicks, units_sold). When calculating CPC (Cost Per Click), use the formula: ad_spend / clicks from the 'ad_sales' table.
-- The 'total_sales' table contains total sales data (total_sales, total_units_ordered)
-- The 'eligibility' table contains product eligibility information
-- RoAS (Return on Ad Spend) = ad_sales / ad_spend. When calculating RoAS, use the formula: ad_sales / ad_spend from the 'ad_sales' table.
-- Use proper SQL syntax for SQLite
-- Return only the SQL query, no explanations
-
-Convert this natural language question into a SQLite SQL query:
-Question: {question}
-
-SQL Query:"""
-
-        response = ollama.generate(model=model, prompt=prompt)
+        response = ollama.generate(model=model, prompt=_PROMPT_TEMPLATE.format(
+            schema=schema_str, notes=notes_str, question=question))
         sql_query = response['response'].strip()
         
         # Clean up the response - remove any markdown formatting
@@ -169,7 +382,11 @@ SQL Query:"""
         sql_query = re.sub(r'```\s*', '', sql_query)
         sql_query = sql_query.strip()
         
-        return sql_query
+        if sql_query:
+            _sql_cache.put(cache_key, sql_query)
+            _semantic_sql_cache.put(question, sql_query, namespace=(db_name, model))
+        
+        return sql_query, ()
         
     except ImportError:
         print("Ollama not available, using fallback SQL generation...")
@@ -178,26 +395,99 @@ SQL Query:"""
         print(f"Error with Ollama, using fallback: {str(e)}")
         return natural_language_to_sql_fallback(question, db_name)
 
-def execute_sql_query(sql_query: str, db_name='ecommerce.db') -> Tuple[List[Tuple], List[str]]:
+# String literals and quoted identifiers ('...', "...", [...], `...`) are matched whole
+# so they pass through unchanged; runs of comments and whitespace become one space
+_SQL_TOKEN_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|\[[^\]]*\]|`(?:[^`]|``)*`|(?:--[^\n]*|/\*.*?\*/|\s)+""", re.S)
+
+def normalize_sql(sql_query: str) -> str:
     """
-    Execute SQL query and return results with column names.
-    Returns (results, column_names)
+    Collapse whitespace and drop comments outside string literals and quoted
+    identifiers, so that equivalent SQL text hits the same result and statement cache entries.
+    """
+    return _SQL_TOKEN_RE.sub(lambda m: m.group(0) if m.group(0)[0] in '\'"[`' else ' ', sql_query).strip()
+
+def split_sql_statements(sql_query: str) -> List[str]:
+    """
+    Split generated SQL into its individual statements.
+    Semicolons inside string literals do not split a statement, and pieces
+    holding only comments (e.g. a trailing "-- note") are dropped.
+    """
+    statements = []
+    current = ''
+    for part in sql_query.split(';'):
+        current += part + ';'
+        if sqlite3.complete_statement(current):
+            if _has_sql(current):
+                statements.append(current.strip())
+            current = ''
+    if _has_sql(current):
+        statements.append(current.strip().rstrip(';'))
+    return statements
+
+def _has_sql(statement: str) -> bool:
+    """True if the statement holds more than comments, whitespace and semicolons."""
+    return bool(normalize_sql(statement).strip(' ;'))
+
+# Rows pulled from SQLite per fetchmany() call
+FETCH_BATCH_SIZE = 1000
+
+def iter_sql_query(sql_query: str, db_name='ecommerce.db', params: Tuple = (),
+                   batch_size=FETCH_BATCH_SIZE) -> Iterator[Tuple[List[Tuple], List[str]]]:
     """
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+    Execute SQL query (binding params to its ? placeholders) and yield
+    (rows, column_names) in batches of up to batch_size rows.
+    Always yields at least once so callers get the column names of empty results.
+    """
+    sql_query = normalize_sql(sql_query)
+    params = tuple(params)
+    cache_key = (db_name, sql_query, params)
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    
+    conn = _get_connection(db_name)
+    results = []
     
+    # No `with conn:` block: the authorizer rejects writes, so there is no transaction
+    # to commit, and the cursor has to stay open across the yields below
     try:
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
+        cursor = conn.cursor()
+        cursor.arraysize = batch_size
+        cursor.execute(sql_query, params)
         
         # Get column names
         column_names = [description[0] for description in cursor.description] if cursor.description else []
         
-        return results, column_names
+        batch = cursor.fetchmany()
     except Exception as e:
         raise Exception(f"SQL execution error: {str(e)}")
-    finally:
-        conn.close()
+    
+    yield batch, column_names
+    while batch:
+        results.extend(batch)
+        try:
+            batch = cursor.fetchmany()
+        except Exception as e:
+            raise Exception(f"SQL execution error: {str(e)}")
+        if batch:
+            yield batch, column_names
+    
+    _result_cache.put(cache_key, (results, column_names))
+
+def execute_sql_query(sql_query: str, db_name='ecommerce.db', params: Tuple = ()) -> Tuple[List[Tuple], List[str]]:
+    """
+    Execute SQL query and return results with column names.
+    Returns (results, column_names)
+    """
+    results = []
+    column_names = []
+    for batch, column_names in iter_sql_query(sql_query, db_name, params):
+        results.extend(batch)
+    return results, column_names
+
+# Rows beyond this are elided from the formatted text (the raw results are still returned)
+FORMAT_MAX_ROWS = 1000
 
 def format_results(results: List[Tuple], column_names: List[str]) -> str:
     """
@@ -209,20 +499,16 @@ def format_results(results: List[Tuple], column_names: List[str]) -> str:
     if not column_names:
         return str(results)
     
-    # Create a simple table format
-    formatted = []
-    
-    # Header
-    header = " | ".join(column_names)
-    formatted.append(header)
-    formatted.append("-" * len(header))
-    
-    # Rows
-    for row in results:
-        row_str = " | ".join([str(val) if val is not None else "NULL" for val in row])
-        formatted.append(row_str)
-    
-    return "\n".join(formatted)
+    # Let pandas do the per-cell string conversion and column alignment.
+    # Object dtype keeps each value as SQLite returned it (a NULL would turn an
+    # INTEGER column into floats), and float_format=str keeps full float precision.
+    df = pd.DataFrame(results, columns=column_names, dtype=object).fillna('NULL')
+    return df.to_string(index=False, float_format=str, max_rows=FORMAT_MAX_ROWS)
+
+# Build the prompt fragments at import (schema and sample data are static at runtime),
+# so no request has to query them. Skipped before the database has been created.
+if os.path.exists('ecommerce.db'):
+    _schema_prompt_fragments('ecommerce.db')
 
 if __name__ == '__main__':
     # Test the interface
@@ -243,10 +529,12 @@ if __name__ == '__main__':
     for question in test_questions:
         print(f"\nQuestion: {question}")
         try:
-            sql_query = natural_language_to_sql(question)
+            sql_query, params = natural_language_to_sql(question)
             print(f"Generated SQL: {sql_query}")
+            if params:
+                print(f"Parameters: {params}")
             
-            results, columns = execute_sql_query(sql_query)
+            results, columns = execute_sql_query(sql_query, params=params)
             formatted = format_results(results, columns)
             print(f"Results:\n{formatted}")
         except Exception as e:
@@ -0,0 +1,215 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Filler words that do not change the meaning of a question.
+# Negations ("not", "no") and ranking words ("top", "highest") are deliberately kept.
+STOPWORDS = (
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'what', 'whats', 'show', 'me',
+    'give', 'tell', 'list', 'display', 'find', 'get', 'please', 'can', 'could', 'you',
+    'i', 'we', 'my', 'our', 'of', 'for', 'in', 'on', 'to', 'all', 'do', 'does', 'us',
+)
+
+# Comparison operators and signs change a question's meaning, so they are spelled out
+# as words before punctuation is stripped ("sales > 100" and "sales < 100" must differ)
+_OPERATOR_WORDS = (
+    (re.compile(r"!=|<>"), ' ne '),
+    (re.compile(r">="), ' ge '),
+    (re.compile(r"<="), ' le '),
+    (re.compile(r">"), ' gt '),
+    (re.compile(r"<"), ' lt '),
+    (re.compile(r"="), ' eq '),
+    (re.compile(r"(?<![\w.])-(?=\d)"), ' minus '),
+)
+# Words that must agree before the semantic cache may reuse an answer:
+# operators, negations and ranking direction
+_GUARD_WORDS = frozenset({
+    'ne', 'ge', 'le', 'gt', 'lt', 'eq', 'minus',
+    'not', 'no', 'non', 'never', 'without', 'except', 'excluding', 'ineligible',
+    'highest', 'lowest', 'most', 'least', 'max', 'min', 'maximum', 'minimum',
+    'top', 'bottom', 'best', 'worst', 'asc', 'desc', 'first', 'last',
+})
+
+# Punctuation, except a decimal point between digits
+_PUNCTUATION_RE = re.compile(r"(?<!\d)\.|\.(?!\d)|[^\w\s.]")
+_STOPWORD_RE = re.compile(r"\b(?:" + "|".join(STOPWORDS) + r")\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+@lru_cache(maxsize=1024)
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so that trivially different phrasings share a cache key.
+    Lowercases, spells out comparison operators, strips punctuation and stopwords,
+    and collapses whitespace.
+    """
+    normalized = question.lower()
+    for operator_re, word in _OPERATOR_WORDS:
+        normalized = operator_re.sub(word, normalized)
+    normalized = _PUNCTUATION_RE.sub(' ', normalized)
+    normalized = _STOPWORD_RE.sub(' ', normalized)
+    return _WHITESPACE_RE.sub(' ', normalized).strip()
+
+def _match_guard(question: str) -> Tuple[str, ...]:
+    """
+    Numbers, operators, negations and ranking words of a question, in order.
+    Two questions may only share a semantic cache entry if these are identical.
+    """
+    return tuple(token for token in normalize_question(question).split()
+                 if token in _GUARD_WORDS or _NUMBER_RE.fullmatch(token))
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+    Values are stored as (timestamp, value) tuples; expired entries are
+    dropped on lookup and by a periodic sweep triggered from `put`.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            ts, value = entry
+            if time.monotonic() - ts > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            if now - self._last_sweep > self.ttl:
+                self._sweep(now)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def sweep(self) -> None:
+        with self._lock:
+            self._sweep(time.monotonic())
+
+    def _sweep(self, now: float) -> None:
+        expired = [key for key, (ts, _) in self._data.items() if now - ts > self.ttl]
+        for key in expired:
+            del self._data[key]
+        self._last_sweep = now
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SemanticCache:
+    """
+    Cache keyed by question meaning rather than exact text.
+    Questions are embedded with `embed_fn`; a lookup returns the value of the
+    most similar stored question if the cosine similarity reaches `threshold`
+    and both questions mention the same numbers, comparison operators,
+    negations and ranking words (so "item id 5" never reuses the answer for
+    "item id 6", nor "sales > 100" the answer for "sales < 100", nor "highest"
+    the answer for "lowest").
+    """
+
+    def __init__(self, embed_fn: Callable[[str], Sequence[float]], threshold: float = 0.92,
+                 maxsize: int = 1024, ttl: float = 3600.0):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._embed = lru_cache(maxsize=256)(embed_fn)
+        self._matrix: Optional[np.ndarray] = None
+        self._entries: List[Tuple[float, Hashable, Tuple[str, ...], Any]] = []
+        self._lock = threading.Lock()
+
+    def _embedding(self, question: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self._embed(normalize_question(question)), dtype=np.float32)
+        except Exception as e:
+            print(f"Semantic cache embedding failed: {str(e)}")
+            return None
+        norm = np.linalg.norm(vector)
+        if vector.ndim != 1 or norm == 0:
+            return None
+        return vector / norm
+
+    def get(self, question: str, namespace: Hashable = None) -> Optional[Any]:
+        with self._lock:
+            if self._matrix is None:
+                return None
+        embedding = self._embedding(question)
+        if embedding is None:
+            return None
+        guard = _match_guard(question)
+        now = time.monotonic()
+
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+                return None
+            similarities = self._matrix @ embedding
+            for idx in np.argsort(similarities)[::-1]:
+                if similarities[idx] < self.threshold:
+                    break
+                ts, entry_namespace, entry_guard, value = self._entries[idx]
+                if now - ts > self.ttl:
+                    continue
+                if entry_namespace == namespace and entry_guard == guard:
+                    return value
+        return None
+
+    def put(self, question: str, value: Any, namespace: Hashable = None) -> None:
+        embedding = self._embedding(question)
+        if embedding is None:
+            return
+        entry = (time.monotonic(), namespace, _match_guard(question), value)
+
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+                self._matrix = embedding[np.newaxis, :]
+                self._entries = [entry]
+                return
+            now = entry[0]
+            keep = [i for i, (ts, *_rest) in enumerate(self._entries) if now - ts <= self.ttl]
+            keep = keep[-(self.maxsize - 1):] if self.maxsize > 1 else []
+            self._matrix = np.vstack([self._matrix[keep], embedding])
+            self._entries = [self._entries[i] for i in keep] + [entry]
+
+    def discard(self, value: Any, namespace: Hashable = None) -> None:
+        """
+        Drop every entry of `namespace` holding `value`, whichever question stored it.
+        """
+        with self._lock:
+            if self._matrix is None:
+                return
+            keep = [i for i, (_ts, entry_namespace, _guard, entry_value) in enumerate(self._entries)
+                    if entry_namespace != namespace or entry_value != value]
+            if not keep:
+                self._matrix = None
+                self._entries = []
+                return
+            self._matrix = self._matrix[keep]
+            self._entries = [self._entries[i] for i in keep]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._matrix = None
+            self._entries = []
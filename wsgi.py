@@ -0,0 +1,10 @@
+# WSGI entry point for production servers, e.g.
+#   gunicorn -w 4 -k gthread --threads 8 --preload wsgi:app
+# With --preload this module is imported once in the master process and the
+# workers are forked from it, sharing the imported libraries and warm caches.
+from api import app
+from llm_interface import close_connections
+
+# Importing llm_interface filled the schema / prompt caches; close the connection used
+# to do it before the workers are forked: SQLite connections must not cross fork().
+close_connections()